@@ -0,0 +1,139 @@
+import time
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from recipes.models import Recipe
+
+RECIPES_GENERATION_KEY = 'recipes:generation'
+TAGS_GENERATION_KEY = 'tags:generation'
+INGREDIENTS_GENERATION_KEY = 'ingredients:generation'
+USER_GENERATION_KEY = 'user:{}:generation'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_generation_cache():
+    return caches[settings.GENERATION_CACHE_ALIAS]
+
+
+def get_generation(key):
+    cache = get_generation_cache()
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(key):
+    get_generation_cache().set(key, time.time_ns(), timeout=None)
+
+
+def get_recipes_generation():
+    return get_generation(RECIPES_GENERATION_KEY)
+
+
+def bump_recipes_generation():
+    bump_generation(RECIPES_GENERATION_KEY)
+
+
+def bump_user_generation(user_id):
+    bump_generation(USER_GENERATION_KEY.format(user_id))
+
+
+def get_normalized_url(request):
+    query = urlencode(sorted(
+        (key, sorted(values))
+        for key, values in request.query_params.lists()
+    ), doseq=True)
+    return f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+
+
+def get_response_cache_key(request, generation):
+    return 'recipes:response:{}:{}'.format(
+        generation, md5(get_normalized_url(request).encode()).hexdigest()
+    )
+
+
+def conditional_response(request, handler, version, last_modified,
+                         *args, **kwargs):
+    etag = quote_etag(md5(':'.join(map(str, (
+        get_normalized_url(request), request.accepted_media_type, *version
+    ))).encode()).hexdigest())
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is not None:
+        return response
+    response = handler(request, *args, **kwargs)
+    if response.status_code == 200:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class AnonymousResponseCacheMixin:
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request,
+                                        *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(super().retrieve, request,
+                                        *args, **kwargs)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if (request.method not in SAFE_METHODS
+                or not request.user.is_anonymous):
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        key = get_response_cache_key(request, get_recipes_generation())
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+
+class GenerationConditionalListMixin:
+    generation_key = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_list(super().list, request,
+                                         *args, **kwargs)
+
+    def get_conditional_list(self, handler, request, *args, **kwargs):
+        generation = get_generation(self.generation_key)
+        return conditional_response(
+            request, handler, (generation,), generation // 10 ** 9,
+            *args, **kwargs
+        )
+
+
+def get_recipe_version(request, pk):
+    if not str(pk).isdigit():
+        return None
+    updated_at = Recipe.objects.filter(pk=pk).values_list(
+        'updated_at', flat=True
+    ).first()
+    if updated_at is None:
+        return None
+    generations = [get_recipes_generation()]
+    if request.user.is_authenticated:
+        generations.append(
+            get_generation(USER_GENERATION_KEY.format(request.user.pk))
+        )
+    last_modified = max(int(updated_at.timestamp()),
+                        max(generations) // 10 ** 9)
+    version = (updated_at.isoformat(), request.user.pk, *generations)
+    return version, last_modified
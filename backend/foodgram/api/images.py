@@ -0,0 +1,108 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+from api.cache import bump_recipes_generation
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def sniff_image_format(header):
+    for signature, ext in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return ext
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def get_image_storage():
+    return Recipe._meta.get_field('image').storage
+
+
+def get_image_variant_urls(recipe, request=None):
+    storage = get_image_storage()
+    variants = recipe.image_variants or {}
+    urls = {}
+    for variant in settings.IMAGE_VARIANTS:
+        name = variants.get(variant, recipe.image.name)
+        url = storage.url(name) if name else None
+        if url and request is not None:
+            url = request.build_absolute_uri(url)
+        urls[variant] = url
+    return urls
+
+
+def render_variant(image, size):
+    variant = image.copy()
+    if size:
+        variant.thumbnail(size)
+    if variant.mode not in ('RGB', 'RGBA'):
+        variant = variant.convert(
+            'RGBA' if 'transparency' in variant.info else 'RGB'
+        )
+    buffer = BytesIO()
+    variant.save(buffer, 'WEBP', quality=settings.IMAGE_VARIANT_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def build_image_variants(recipe_id, name):
+    storage = get_image_storage()
+    try:
+        with storage.open(name) as file:
+            image = Image.open(file)
+            image.load()
+        upload_to = Recipe._meta.get_field('image').upload_to
+        variants = {
+            variant: storage.save(f'{upload_to}{variant}.webp',
+                                  render_variant(image, size))
+            for variant, size in settings.IMAGE_VARIANTS.items()
+        }
+        if Recipe.objects.filter(pk=recipe_id, image=name).update(
+                image_variants=variants):
+            bump_recipes_generation()
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='image-variants'
+            )
+        return _executor
+
+
+def reset_image_variants(recipe):
+    recipe.image_variants = {}
+    Recipe.objects.filter(pk=recipe.pk).update(image_variants={})
+    transaction.on_commit(lambda: schedule_image_variants(recipe))
+
+
+def schedule_image_variants(recipe):
+    if not settings.IMAGE_WORKERS:
+        build_image_variants(recipe.pk, recipe.image.name)
+        return
+    get_executor().submit(build_image_variants, recipe.pk, recipe.image.name)
@@ -0,0 +1,87 @@
+from bisect import bisect_left
+from threading import Lock
+
+from api.cache import (INGREDIENTS_GENERATION_KEY, TAGS_GENERATION_KEY,
+                       get_generation)
+from recipes.models import Ingredient, Tag
+
+
+class VersionedIndex:
+    model = None
+    generation_key = None
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._data = None
+
+    def build(self, objects):
+        raise NotImplementedError
+
+    def get_data(self):
+        version = get_generation(self.generation_key)
+        with self._lock:
+            if self._version != version:
+                self._data = self.build(list(self.model.objects.all()))
+                self._version = version
+            return self._data
+
+    def get(self, pk):
+        return self.get_data()['by_id'].get(pk)
+
+
+class TagIndex(VersionedIndex):
+    model = Tag
+    generation_key = TAGS_GENERATION_KEY
+
+    def build(self, tags):
+        tags.sort(key=lambda tag: tag.pk)
+        return {
+            'all': tags,
+            'by_id': {tag.pk: tag for tag in tags},
+            'by_slug': {tag.slug: tag.pk for tag in tags},
+        }
+
+    def all(self):
+        return self.get_data()['all']
+
+    def slugs(self):
+        return [(slug, slug) for slug in self.get_data()['by_slug']]
+
+    def ids_for_slugs(self, slugs):
+        by_slug = self.get_data()['by_slug']
+        return [by_slug[slug] for slug in slugs if slug in by_slug]
+
+
+class IngredientPrefixIndex(VersionedIndex):
+    model = Ingredient
+    generation_key = INGREDIENTS_GENERATION_KEY
+
+    def build(self, ingredients):
+        ingredients.sort(
+            key=lambda ingredient: (ingredient.name.casefold(), ingredient.pk)
+        )
+        return {
+            'by_id': {ingredient.pk: ingredient for ingredient in ingredients},
+            'keys': [ingredient.name.casefold() for ingredient in ingredients],
+            'rows': [{
+                'id': ingredient.pk,
+                'name': ingredient.name,
+                'measurement_unit': ingredient.measurement_unit,
+            } for ingredient in ingredients],
+        }
+
+    def search(self, prefix='', limit=None):
+        data = self.get_data()
+        keys, rows = data['keys'], data['rows']
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = start
+        stop = len(keys) if limit is None else min(len(keys), start + limit)
+        while end < stop and keys[end].startswith(prefix):
+            end += 1
+        return rows[start:end]
+
+
+tag_index = TagIndex()
+ingredient_index = IngredientPrefixIndex()
@@ -0,0 +1,123 @@
+import json
+import logging
+import random
+
+from django.conf import settings
+
+from api.profiling import RequestProfile, is_profiling_requested
+from api.queries import (QueryBudgetExceeded, QueryRecorder,
+                         format_budget_error)
+
+logger = logging.getLogger('api.queries')
+
+
+def get_view_label(view_func, method):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return getattr(view_func, '__name__', None), None, None
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+    budget = getattr(view_class, 'query_budgets', {}).get(action)
+    return view_class.__name__, action, budget
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        request.query_budget = (None, None, None)
+        with recorder.record():
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.record_streaming(
+                request, response, recorder, response.streaming_content
+            )
+            return response
+        self.report(request, response, recorder)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_view_label(view_func, request.method)
+
+    def record_streaming(self, request, response, recorder, content):
+        with recorder.record():
+            yield from content
+        self.report(request, response, recorder)
+
+    def report(self, request, response, recorder):
+        view, action, budget = request.query_budget
+        stats = recorder.get_stats()
+        response.query_stats = stats
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': view,
+            'action': action,
+            'budget': budget,
+            **stats,
+        }
+        if not response.streaming and settings.QUERY_BUDGET_HEADERS:
+            response['X-DB-Queries'] = stats['queries']
+            response['X-DB-Time-Ms'] = stats['db_time_ms']
+            response['X-DB-Duplicates'] = sum(
+                duplicate['count'] for duplicate in stats['duplicates']
+            )
+        if budget is None or stats['queries'] <= budget:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(json.dumps(record, ensure_ascii=False))
+            return
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(
+                format_budget_error(f'{view}.{action}', budget, stats)
+            )
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        forced = is_profiling_requested(request)
+        if not forced and random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profile = RequestProfile()
+        request.profiled_view = None
+        with profile.enabled():
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.profile_streaming(
+                request, profile, forced, response.streaming_content
+            )
+            return response
+        name = self.save(request, profile, forced)
+        if name is not None and forced:
+            response['X-Profile'] = name
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view, action, _ = get_view_label(view_func, request.method)
+        request.profiled_view = f'{view}.{action}' if action else view
+
+    def profile_streaming(self, request, profile, forced, content):
+        iterator = iter(content)
+        while True:
+            with profile.enabled():
+                chunk = next(iterator, None)
+            if chunk is None:
+                break
+            yield chunk
+        self.save(request, profile, forced)
+
+    def save(self, request, profile, forced):
+        if (not forced and profile.duration * 1000
+                < settings.PROFILING_MIN_DURATION_MS):
+            return None
+        return profile.save(
+            request.profiled_view, getattr(request, 'user', None)
+        )
@@ -0,0 +1,64 @@
+import cProfile
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+PROFILE_NAME = re.compile(
+    r'^(?P<created>\d{8}T\d{6})-(?P<view>[\w.]+)-(?P<user>\w+)-'
+    r'(?P<duration>\d+)ms-[0-9a-f]+\.prof$'
+)
+UNSAFE_CHARS = re.compile(r'[^\w.]')
+
+
+class RequestProfile:
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.duration = 0.0
+
+    @contextmanager
+    def enabled(self):
+        started = time.perf_counter()
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+            self.duration += time.perf_counter() - started
+
+    def save(self, view, user):
+        duration = round(self.duration * 1000)
+        user_tag = user.pk if user and user.is_authenticated else 'anonymous'
+        name = '-'.join((
+            time.strftime('%Y%m%dT%H%M%S', time.gmtime()),
+            UNSAFE_CHARS.sub('_', view or 'unknown'),
+            str(user_tag),
+            f'{duration}ms',
+            uuid.uuid4().hex[:8],
+        )) + '.prof'
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.profiler.dump_stats(directory / name)
+        return name
+
+
+def is_profiling_requested(request):
+    if settings.PROFILING_HEADER not in request.META:
+        return False
+    try:
+        authenticated = TokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+def parse_profile_name(name):
+    match = PROFILE_NAME.match(name)
+    if match is None:
+        return None
+    return {**match.groupdict(), 'duration': int(match['duration'])}
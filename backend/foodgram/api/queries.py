@@ -0,0 +1,108 @@
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+IN_PARAMS = re.compile(r'\((?:%s, )+%s\)')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def get_fingerprint(sql):
+    return IN_PARAMS.sub('(...)', sql)
+
+
+def get_origin():
+    base_dir = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(base_dir) and filename != __file__
+                and 'site-packages' not in filename):
+            return (f'{filename[len(base_dir) + 1:]}:{frame.f_lineno} '
+                    f'in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return None
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.durations = defaultdict(float)
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            fingerprint = get_fingerprint(sql)
+            self.count += 1
+            self.duration += duration
+            self.fingerprints[fingerprint] += 1
+            self.durations[fingerprint] += duration
+            if fingerprint not in self.origins:
+                self.origins[fingerprint] = get_origin()
+
+    @contextmanager
+    def record(self):
+        with _wrap_connections(self):
+            yield self
+
+    def get_stats(self, top=None):
+        top = settings.QUERY_BUDGET_TOP if top is None else top
+        return {
+            'queries': self.count,
+            'db_time_ms': round(self.duration * 1000, 2),
+            'duplicates': [
+                {
+                    'sql': fingerprint,
+                    'count': count,
+                    'db_time_ms': round(self.durations[fingerprint] * 1000,
+                                        2),
+                    'origin': self.origins[fingerprint],
+                }
+                for fingerprint, count in self.fingerprints.most_common(top)
+                if count > 1
+            ],
+        }
+
+
+@contextmanager
+def _wrap_connections(recorder):
+    wrappers = [connection.execute_wrapper(recorder)
+                for connection in connections.all()]
+    for wrapper in wrappers:
+        wrapper.__enter__()
+    try:
+        yield
+    finally:
+        for wrapper in reversed(wrappers):
+            wrapper.__exit__(None, None, None)
+
+
+def format_budget_error(label, budget, stats):
+    lines = [f'{label}: {stats["queries"]} запросов при бюджете {budget}.']
+    for duplicate in stats['duplicates']:
+        lines.append(f'  {duplicate["count"]}x {duplicate["origin"]}: '
+                     f'{duplicate["sql"][:200]}')
+    return '\n'.join(lines)
+
+
+@contextmanager
+def assert_query_budget(budget, label='Блок'):
+    recorder = QueryRecorder()
+    with recorder.record():
+        yield recorder
+    stats = recorder.get_stats()
+    if stats['queries'] > budget:
+        raise QueryBudgetExceeded(format_budget_error(label, budget, stats))
@@ -1,14 +1,21 @@
 import base64
+import binascii
+
+from django.conf import settings
 from django.contrib.auth.hashers import check_password
 from django.core.files.base import ContentFile
 from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from api.utils import creating_an_ingredient
+from api.images import get_image_variant_urls, sniff_image_format
+from api.indexes import tag_index
+from api.utils import (creating_an_ingredient, get_recipe_queryset,
+                       get_subscribed_authors, updating_an_ingredient)
 from recipes.models import (AmountOfIngredient, Favorite,
-                            Ingredient, Recipe, ShoppingCart, Tag)
+                            Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag)
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
-from users.models import User, Subscription
+from users.models import User
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -18,6 +25,17 @@ class UserCreateSerializer(UserCreateSerializer):
                   'first_name', 'last_name', 'password')
 
 
+class UserListSerializer(serializers.ListSerializer):
+    def get_authors(self, data):
+        return data
+
+    def to_representation(self, data):
+        request = self.context.get('request')
+        if request and not request.user.is_anonymous:
+            get_subscribed_authors(request, self.get_authors(data))
+        return super().to_representation(data)
+
+
 class UserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
@@ -25,24 +43,40 @@ class UserSerializer(UserSerializer):
         model = User
         fields = ('email', 'id', 'username',
                   'first_name', 'last_name', 'is_subscribed')
+        list_serializer_class = UserListSerializer
 
     def get_is_subscribed(self, obj):
         if (self.context.get('request')
            and not self.context['request'].user.is_anonymous):
-            return Subscription.objects.filter(
-                user=self.context['request'].user,
-                author=obj
-            ).exists()
+            return get_subscribed_authors(
+                self.context['request'], [obj]
+            )[obj.pk]
         return False
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+        'invalid_base64': 'Некорректное изображение в base64.',
+        'unknown_format': 'Неподдерживаемый формат изображения.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            if ';base64,' not in data:
+                self.fail('invalid_base64')
+            imgstr = data.split(';base64,', 1)[1]
+            max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+            if len(imgstr) * 3 // 4 > max_size:
+                self.fail('too_large', max_size=max_size)
+            try:
+                ext = sniff_image_format(base64.b64decode(imgstr[:16]))
+                if ext is None:
+                    self.fail('unknown_format')
+                content = base64.b64decode(imgstr, validate=True)
+            except (binascii.Error, ValueError):
+                self.fail('invalid_base64')
+            data = ContentFile(content, name='temp.' + ext)
 
         return super().to_internal_value(data)
 
@@ -77,19 +111,31 @@ class SetPasswordSerializer(serializers.Serializer):
 
 class RecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField(read_only=True)
+    image_variants = serializers.SerializerMethodField()
     name = serializers.ReadOnlyField()
     cooking_time = serializers.ReadOnlyField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'name',
-                  'image', 'cooking_time')
+                  'image', 'image_variants', 'cooking_time')
+
+    def get_image_variants(self, obj):
+        return get_image_variant_urls(obj, self.context.get('request'))
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPES_BATCH_MAX_SIZE
+    )
 
 
 class SubscribeInfoSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -98,21 +144,19 @@ class SubscribeInfoSerializer(UserSerializer):
                   'recipes', 'recipes_count',)
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        request = self.context.get('request')
         return (
-            self.context.get('request').user.is_authenticated
-            and Subscription.objects.filter(user=self.context['request'].user,
-                                            author=obj).exists()
+            request.user.is_authenticated
+            and get_subscribed_authors(request, [obj])[obj.pk]
         )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
+        limit = self.context.get('recipes_limit')
         recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if limit is not None:
+            recipes = recipes[:limit]
         serializer = RecipeSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
@@ -122,7 +166,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField()
     is_subscribed = serializers.SerializerMethodField()
     recipes = RecipeSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = User
@@ -137,15 +181,12 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return obj
 
     def get_is_subscribed(self, obj):
+        request = self.context.get('request')
         return (
-            self.context.get('request').user.is_authenticated
-            and Subscription.objects.filter(user=self.context['request'].user,
-                                            author=obj).exists()
+            request.user.is_authenticated
+            and get_subscribed_authors(request, [obj])[obj.pk]
         )
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
@@ -174,6 +215,11 @@ class IngredientPostSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class RecipeListSerializer(UserListSerializer):
+    def get_authors(self, data):
+        return [recipe.author for recipe in data]
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
@@ -182,14 +228,21 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart', 'name',
-                  'image', 'text', 'cooking_time')
+                  'image', 'image_variants', 'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+    def get_image_variants(self, obj):
+        return get_image_variant_urls(obj, self.context.get('request'))
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and Favorite.objects.filter(
@@ -197,6 +250,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
                 ).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and ShoppingCart.objects.filter(
@@ -204,9 +259,22 @@ class RecipeReadSerializer(serializers.ModelSerializer):
                 ).exists())
 
 
+class TagPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            tag = tag_index.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if tag is None:
+            self.fail('does_not_exist', pk_value=data)
+        return tag
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
     ingredients = IngredientPostSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = TagPrimaryKeyField(
         queryset=Tag.objects.all(),
         many=True
     )
@@ -217,16 +285,21 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         fields = ('ingredients', 'tags', 'image',
                   'name', 'text', 'cooking_time')
 
+    def is_required(self, field, data):
+        return not self.partial or field in data
+
     def validate(self, data):
         for field in ['name', 'text', 'cooking_time']:
-            if not data.get(field):
+            if self.is_required(field, data) and not data.get(field):
                 raise serializers.ValidationError(
                     f'{field} - Обязательное поле.'
                 )
-        if not data.get('tags'):
+        if self.is_required('tags', data) and not data.get('tags'):
             raise serializers.ValidationError(
                 'Минимум 1 тэг.'
             )
+        if not self.is_required('ingredients', data):
+            return data
         if not data.get('ingredients'):
             raise serializers.ValidationError(
                 'Минимум 1 ингредиент.'
@@ -239,6 +312,17 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Ингредиенты должны быть уникальны.'
             )
+        missing_ingredients = unique_ingredient_id_list - set(
+            Ingredient.objects.filter(
+                id__in=unique_ingredient_id_list
+            ).values_list('id', flat=True)
+        )
+        if missing_ingredients:
+            raise serializers.ValidationError(
+                'Ингредиенты не найдены: {}.'.format(
+                    ', '.join(map(str, sorted(missing_ingredients)))
+                )
+            )
         return data
 
     @transaction.atomic
@@ -253,18 +337,26 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        AmountOfIngredient.objects.filter(recipe=instance).delete()
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        changed_ingredients = set()
+        if ingredients is not None:
+            changed_ingredients = updating_an_ingredient(ingredients,
+                                                         instance)
         super().update(instance, validated_data)
-        creating_an_ingredient(ingredients, instance)
-        instance.save()
+        if changed_ingredients:
+            ShoppingListItem.objects.schedule_refresh(
+                recipes=[instance.pk], ingredients=changed_ingredients
+            )
         return instance
 
     def to_representation(self, instance):
         request = self.context.get('request')
+        instance = get_recipe_queryset(
+            request and request.user
+        ).get(pk=instance.pk)
         return RecipeReadSerializer(
             instance,
             context={'request': request}
@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import (INGREDIENTS_GENERATION_KEY, RECIPES_GENERATION_KEY,
+                       TAGS_GENERATION_KEY, USER_GENERATION_KEY,
+                       bump_generation)
+from api.images import reset_image_variants, schedule_image_variants
+from foodgram.transactions import on_commit_once
+from recipes.models import (AmountOfIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscription, User
+
+
+def bump_generations(keys):
+    for key in keys:
+        bump_generation(key)
+
+
+def bump_on_commit(*keys):
+    on_commit_once('generations', bump_generations, keys)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=AmountOfIngredient)
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_responses(**kwargs):
+    bump_on_commit(RECIPES_GENERATION_KEY)
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_author_responses(created=False, update_fields=None,
+                                **kwargs):
+    if created or update_fields and set(update_fields) <= {'last_login'}:
+        return
+    bump_on_commit(RECIPES_GENERATION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    bump_on_commit(TAGS_GENERATION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    bump_on_commit(INGREDIENTS_GENERATION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscription)
+def invalidate_user_flags(instance, **kwargs):
+    bump_on_commit(USER_GENERATION_KEY.format(instance.user_id))
+
+
+@receiver(post_save, sender=Recipe)
+def process_recipe_image(instance, created, raw=False, **kwargs):
+    if raw or 'image' not in getattr(instance, 'changed_fields', {'image'}):
+        return
+    if created:
+        transaction.on_commit(lambda: schedule_image_variants(instance))
+    else:
+        reset_image_variants(instance)
@@ -1,6 +1,87 @@
+import io
+import json
+import os
+import tempfile
+from base64 import b64encode
 from http import HTTPStatus
+from unittest import mock
 
-from django.test import Client, TestCase
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.cache import (RECIPES_GENERATION_KEY, USER_GENERATION_KEY,
+                       get_generation)
+from api.queries import QueryBudgetExceeded, assert_query_budget
+from recipes.models import (AmountOfIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.storage import ContentAddressedStorage
+from users.models import Subscription, User
+
+MEDIA_ROOT = tempfile.TemporaryDirectory()
+
+TEST_SETTINGS = override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'generations': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'generations',
+        },
+    },
+    MEDIA_ROOT=MEDIA_ROOT.name,
+    IMAGE_WORKERS=0,
+)
+
+
+def setUpModule():
+    TEST_SETTINGS.enable()
+
+
+def tearDownModule():
+    TEST_SETTINGS.disable()
+    MEDIA_ROOT.cleanup()
+
+
+def make_image(color='white'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (4, 4), color).save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name='recipe.png')
+
+
+def create_user(username, **fields):
+    return User.objects.create_user(
+        username=username, email=f'{username}@foodgram.ru', **fields
+    )
+
+
+def create_admin(client):
+    admin = User.objects.create_superuser(
+        username='admin', email='admin@foodgram.ru', password='admin'
+    )
+    client.force_login(admin)
+    return admin
+
+
+def create_ingredient(name):
+    return Ingredient.objects.create(name=name, measurement_unit='г')
+
+
+def create_recipe(author, name='Борщ', **fields):
+    fields.setdefault('text', '.')
+    fields.setdefault('image', make_image())
+    fields.setdefault('cooking_time', 60)
+    return Recipe.objects.create(author=author, name=name, **fields)
 
 
 class TaskiAPITestCase(TestCase):
@@ -8,5 +89,483 @@ class TaskiAPITestCase(TestCase):
         self.guest_client = Client()
 
     def test_list_exists(self):
-        response = self.guest_client.get('/api/foodgram/')
+        response = self.guest_client.get('/api/recipes/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_signup_keeps_recipe_cache(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            create_user('new')
+        self.assertEqual(callbacks, [])
+
+    def test_generations_survive_response_cache_clear(self):
+        generation = get_generation(RECIPES_GENERATION_KEY)
+        caches[settings.RESPONSE_CACHE_ALIAS].clear()
+        self.assertEqual(get_generation(RECIPES_GENERATION_KEY), generation)
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class BenchmarkTestCase(TestCase):
+    def test_benchmark_on_generated_data(self):
+        with tempfile.TemporaryDirectory() as media_root:
+            with self.settings(MEDIA_ROOT=media_root):
+                call_command('generate_data', users=5, recipes=10,
+                             stdout=io.StringIO())
+                with tempfile.NamedTemporaryFile('r') as output:
+                    call_command('benchmark', requests=2, warmup=0,
+                                 output=output.name, stdout=io.StringIO())
+                    report = json.load(output)
+        self.assertEqual(report['meta']['recipes'], 10)
+        for name, result in report['scenarios'].items():
+            self.assertEqual(result['errors'], 0, name)
+
+
+class QueryBudgetTestCase(TestCase):
+    def test_repeated_queries_are_reported(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'api/test.py'):
+            with assert_query_budget(1):
+                for _ in range(2):
+                    list(Tag.objects.all())
+
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        self.staff = create_user('staff', is_staff=True)
+        self.user = create_user('user')
+
+    def download(self, user):
+        token = Token.objects.create(user=user)
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/',
+            HTTP_AUTHORIZATION=f'Token {token.key}', HTTP_X_PROFILE='1'
+        )
         self.assertEqual(response.status_code, HTTPStatus.OK)
+        b''.join(response.streaming_content)
+
+    def test_staff_header_profiles_request(self):
+        with tempfile.TemporaryDirectory() as profiling_dir:
+            with self.settings(PROFILING_DIR=profiling_dir):
+                self.download(self.user)
+                self.assertEqual(os.listdir(profiling_dir), [])
+                self.download(self.staff)
+                [name] = os.listdir(profiling_dir)
+                output = io.StringIO()
+                call_command('profile_summary', stdout=output)
+        view = 'RecipeViewSet.download_shopping_cart'
+        self.assertIn(f'-{view}-{self.staff.pk}-', name)
+        self.assertIn(f'{view}: 1 запросов', output.getvalue())
+
+
+class ReferenceDataTestCase(TestCase):
+    def load(self, *args, **options):
+        output = io.StringIO()
+        call_command('load_reference_data', *args, stdout=output, **options)
+        return output.getvalue()
+
+    def test_load_is_idempotent(self):
+        dump = settings.BASE_DIR / 'data' / 'dump.json'
+        self.load(dump)
+        self.assertEqual(Ingredient.objects.count(), 2188)
+        self.assertEqual(Tag.objects.count(), 3)
+        self.assertIn('добавлено 0, пропущено 2188', self.load(dump))
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as file:
+            file.write('name,measurement_unit\nабрикосовое варенье,г\n'
+                       'зира молотая,г\n')
+            file.flush()
+            self.assertIn('добавлено 1, пропущено 1', self.load(file.name))
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as file:
+            file.write('{"name": "сумах молотый", "measurement_unit": "г"}\n'
+                       '{"name": "сумах молотый", "measurement_unit": "г"}\n')
+            file.flush()
+            self.assertIn('добавлено 1, пропущено 1', self.load(file.name))
+        self.assertEqual(Ingredient.objects.count(), 2190)
+
+
+class ContentAddressedStorageTestCase(TestCase):
+    def test_identical_uploads_share_one_file(self):
+        with tempfile.TemporaryDirectory() as location:
+            storage = ContentAddressedStorage(location=location)
+            names = {storage.save('recipes/a.png', ContentFile(b'image'))
+                     for _ in range(2)}
+            [name] = names
+            os.utime(storage.path(name), (0, 0))
+            self.assertEqual(
+                storage.save('recipes/b.png', ContentFile(b'image')), name
+            )
+            self.assertGreater(os.path.getmtime(storage.path(name)), 0)
+            files = os.listdir(os.path.dirname(storage.path(name)))
+        self.assertEqual(files, [os.path.basename(name)])
+
+
+class RecipeSaveTestCase(TestCase):
+    def test_stale_save_keeps_derived_fields(self):
+        recipe = create_recipe(create_user('author'))
+        stale = Recipe.objects.get(pk=recipe.pk)
+        variants = {'card': 'recipes/card.webp'}
+        Recipe.objects.filter(pk=recipe.pk).update(image_variants=variants,
+                                                   favorites_count=3)
+        stale.name = 'Щи'
+        stale.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Щи')
+        self.assertEqual(recipe.image_variants, variants)
+        self.assertEqual(recipe.favorites_count, 3)
+
+    def test_admin_image_change_rebuilds_variants(self):
+        admin = create_admin(self.client)
+        tag = Tag.objects.create(name='обед', color='#adfc03', slug='lunch')
+        beet = create_ingredient('Свекла')
+        recipe = create_recipe(
+            admin, image_variants={'card': 'recipes/stale.webp'}
+        )
+        recipe.tags.set([tag])
+        amount = AmountOfIngredient.objects.create(recipe=recipe,
+                                                   ingredient=beet, amount=300)
+        image = make_image('red')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f'/admin/recipes/recipe/{recipe.pk}/change/',
+                {'author': admin.pk, 'name': 'Борщ', 'text': '.',
+                 'cooking_time': 60, 'tags': [tag.pk],
+                 'image': SimpleUploadedFile('new.png', image.read()),
+                 'recipes-TOTAL_FORMS': 1, 'recipes-INITIAL_FORMS': 1,
+                 'recipes-0-id': amount.pk, 'recipes-0-recipe': recipe.pk,
+                 'recipes-0-ingredient': beet.pk, 'recipes-0-amount': 300}
+            )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        previous_image = recipe.image.name
+        recipe.refresh_from_db()
+        self.assertNotEqual(recipe.image.name, previous_image)
+        self.assertEqual(set(recipe.image_variants),
+                         set(settings.IMAGE_VARIANTS))
+
+
+class CascadeDeleteTestCase(TestCase):
+    def test_cascade_skips_counters_of_deleted_parent(self):
+        author = create_user('author')
+        recipe = create_recipe(author)
+        for number in range(3):
+            user = create_user(f'user{number}')
+            Favorite.objects.create(user=user, recipe=recipe)
+        with CaptureQueriesContext(connection) as context:
+            author.delete()
+        self.assertFalse([
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ])
+        self.assertFalse(Favorite.objects.exists())
+
+
+class RecipeSearchTestCase(TestCase):
+    def setUp(self):
+        author = create_user('author')
+        self.borsch = create_recipe(author, text='Суп со сметаной.')
+        create_recipe(author, 'Омлет', text='Яйца.')
+        AmountOfIngredient.objects.create(
+            recipe=self.borsch, ingredient=create_ingredient('Свекла'),
+            amount=300
+        )
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_search_is_case_insensitive(self):
+        for query in ('борщ', 'СМЕТАН', 'свекла'):
+            self.assertEqual(self.search(query), [self.borsch.pk], query)
+        self.assertEqual(self.search('пицца'), [])
+
+    def test_reads_skip_search_vector(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.borsch.pk}/'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code,
+                                 HTTPStatus.OK)
+            self.assertFalse(
+                [query for query in queries.captured_queries
+                 if 'search_vector' in query['sql']], url
+            )
+
+
+class SearchVectorRefreshTestCase(TransactionTestCase):
+    def test_refresh_is_batched_per_transaction(self):
+        recipe = create_recipe(create_user('author'))
+        onion = create_ingredient('Лук репчатый')
+        garlic = create_ingredient('Чеснок молодой')
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        with mock.patch('recipes.signals.update_search_vectors') as update:
+            with transaction.atomic():
+                recipe.cooking_time = 90
+                recipe.save()
+            update.assert_not_called()
+            with transaction.atomic():
+                recipe.name = 'Борщ украинский'
+                recipe.save()
+                for ingredient in (onion, garlic):
+                    AmountOfIngredient.objects.create(
+                        recipe=recipe, ingredient=ingredient, amount=1
+                    )
+            update.assert_called_once_with({recipe.pk})
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        author = create_user('author')
+        for number in range(5):
+            create_recipe(author, f'Рецепт {number}')
+        first = Recipe.objects.order_by('pk').first()
+        Recipe.objects.exclude(pk=first.pk).update(pub_date=first.pub_date)
+
+    def test_cursor_walks_all_pages_in_order(self):
+        expected = list(Recipe.objects.order_by('-pub_date', '-id')
+                        .values_list('pk', flat=True))
+        seen = []
+        url = '/api/recipes/?limit=2&cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            seen.extend(recipe['id'] for recipe in response.json()['results'])
+            url = response.json()['next']
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_not_found(self):
+        for values in ('x', ['x', 1], [1], [{}, 1]):
+            cursor = b64encode(json.dumps(values).encode()).decode()
+            response = self.client.get('/api/recipes/', {'cursor': cursor})
+            self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND,
+                             values)
+        response = self.client.get('/api/recipes/', {'cursor': '!!'})
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class ConditionalRequestTestCase(TestCase):
+    def assert_not_modified_until(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_tags_etag(self):
+        self.assert_not_modified_until(
+            '/api/tags/',
+            lambda: Tag.objects.create(name='обед', color='#adfc03',
+                                       slug='lunch')
+        )
+
+    def test_recipe_etag(self):
+        recipe = create_recipe(create_user('author'))
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        recipe.name = 'Щи'
+        self.assert_not_modified_until(f'/api/recipes/{recipe.pk}/',
+                                       recipe.save)
+
+
+class ShoppingListSignalsTestCase(TransactionTestCase):
+    def setUp(self):
+        create_admin(self.client)
+        self.author = create_user('author')
+        self.user = create_user('user')
+        self.recipe = create_recipe(self.author)
+        self.beet = create_ingredient('Свекла')
+        self.amount = AmountOfIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.beet, amount=300
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        self.assertEqual(self.get_shopping_list(), [(self.beet.pk, 300)])
+
+    def assert_shopping_lists_consistent(self):
+        call_command('shopping_lists', verify=True, stdout=io.StringIO())
+
+    def get_shopping_list(self):
+        return list(ShoppingListItem.objects.filter(user=self.user)
+                    .values_list('ingredient', 'amount'))
+
+    def test_amount_change_refreshes_shopping_lists(self):
+        response = self.client.post(
+            f'/admin/recipes/amountofingredient/{self.amount.pk}/change/',
+            {'recipe': self.recipe.pk, 'ingredient': self.beet.pk,
+             'amount': 500}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(self.get_shopping_list(), [(self.beet.pk, 500)])
+
+    def test_recipe_delete_refreshes_shopping_lists(self):
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.recipe.pk}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(self.get_shopping_list(), [])
+
+    def test_author_delete_refreshes_shopping_lists(self):
+        self.author.delete()
+        self.assertEqual(self.get_shopping_list(), [])
+        self.assert_shopping_lists_consistent()
+
+    def test_admin_user_delete_refreshes_shopping_lists(self):
+        response = self.client.post(
+            f'/admin/users/user/{self.author.pk}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(self.get_shopping_list(), [])
+        self.assert_shopping_lists_consistent()
+
+    def test_ingredient_delete_refreshes_shopping_lists(self):
+        self.beet.delete()
+        self.assertEqual(self.get_shopping_list(), [])
+        self.assert_shopping_lists_consistent()
+
+
+class ToggleTestCase(TransactionTestCase):
+    def setUp(self):
+        self.author = create_user('author')
+        self.user = create_user('user')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (('обед', '#adfc03', 'lunch'),
+                                      ('ужин', '#f56642', 'dinner'))
+        ]
+        self.beet = create_ingredient('Свекла')
+        self.cabbage = create_ingredient('Капуста')
+        self.recipe = create_recipe(self.author)
+        self.recipe.tags.set(self.tags)
+        AmountOfIngredient.objects.bulk_create([
+            AmountOfIngredient(recipe=self.recipe, ingredient=self.beet,
+                               amount=300),
+            AmountOfIngredient(recipe=self.recipe, ingredient=self.cabbage,
+                               amount=200),
+        ])
+
+    def assert_statuses(self, method, url, statuses):
+        for expected in statuses:
+            response = getattr(self.client, method)(url)
+            self.assertEqual(response.status_code, expected,
+                             f'{method} {url}')
+
+    def get_shopping_list(self, user=None):
+        return dict(ShoppingListItem.objects.filter(user=user or self.user)
+                    .values_list('ingredient', 'amount'))
+
+    def test_favorite(self):
+        url = f'/api/recipes/{self.recipe.pk}/favorite/'
+        generation = get_generation(USER_GENERATION_KEY.format(self.user.pk))
+        self.assert_statuses('post', url, (HTTPStatus.CREATED,
+                                           HTTPStatus.BAD_REQUEST))
+        self.recipe.refresh_from_db()
+        self.assertEqual(Favorite.objects.count(), 1)
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertNotEqual(
+            get_generation(USER_GENERATION_KEY.format(self.user.pk)),
+            generation
+        )
+        self.assert_statuses('delete', url, (HTTPStatus.NO_CONTENT,
+                                             HTTPStatus.NOT_FOUND))
+        self.recipe.refresh_from_db()
+        self.assertEqual(Favorite.objects.count(), 0)
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_shopping_cart(self):
+        url = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        self.assert_statuses('post', url, (HTTPStatus.CREATED,
+                                           HTTPStatus.BAD_REQUEST))
+        self.assertEqual(ShoppingCart.objects.count(), 1)
+        self.assertEqual(self.get_shopping_list(),
+                         {self.beet.pk: 300, self.cabbage.pk: 200})
+        self.assert_statuses('delete', url, (HTTPStatus.NO_CONTENT,
+                                             HTTPStatus.NOT_FOUND))
+        self.assertEqual(ShoppingCart.objects.count(), 0)
+        self.assertEqual(self.get_shopping_list(), {})
+
+    def test_batch_endpoints(self):
+        other = create_recipe(self.author, 'Щи')
+        missing = other.pk + 1
+        for url, model in (('/api/recipes/favorite/', Favorite),
+                           ('/api/recipes/shopping_cart/', ShoppingCart)):
+            for method, recipes, statuses in (
+                ('post', [self.recipe.pk, missing, self.recipe.pk],
+                 ['added', 'not_found']),
+                ('post', [self.recipe.pk, other.pk],
+                 ['already_added', 'added']),
+                ('delete', [other.pk, missing], ['removed', 'not_found']),
+                ('delete', [other.pk], ['not_added']),
+            ):
+                response = getattr(self.client, method)(
+                    url, {'recipes': recipes}, format='json'
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertEqual(
+                    [(result['id'], result['status'])
+                     for result in response.json()['results']],
+                    list(zip(dict.fromkeys(recipes), statuses)),
+                    f'{method} {url} {recipes}'
+                )
+            self.assertEqual(
+                list(model.objects.values_list('user', 'recipe')),
+                [(self.user.pk, self.recipe.pk)]
+            )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(self.get_shopping_list(),
+                         {self.beet.pk: 300, self.cabbage.pk: 200})
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        self.assert_statuses('post', url, (HTTPStatus.CREATED,
+                                           HTTPStatus.BAD_REQUEST))
+        self.author.refresh_from_db()
+        self.assertEqual(Subscription.objects.count(), 1)
+        self.assertEqual(self.author.followers_count, 1)
+        self.assert_statuses('delete', url, (HTTPStatus.NO_CONTENT,
+                                             HTTPStatus.NOT_FOUND))
+        self.author.refresh_from_db()
+        self.assertEqual(Subscription.objects.count(), 0)
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_partial_update_by_diff(self):
+        self.client.force_authenticate(self.author)
+        url = f'/api/recipes/{self.recipe.pk}/'
+        amounts = dict(AmountOfIngredient.objects.values_list('ingredient',
+                                                              'pk'))
+        response = self.client.patch(url, {'name': 'Борщ с пампушками'},
+                                     format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            dict(AmountOfIngredient.objects.values_list('ingredient', 'pk')),
+            amounts
+        )
+        self.assertEqual(set(self.recipe.tags.all()), set(self.tags))
+
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.patch(url, {'ingredients': [
+            {'id': self.beet.pk, 'amount': 500},
+            {'id': self.cabbage.pk, 'amount': 200},
+        ]}, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            list(AmountOfIngredient.objects.filter(ingredient=self.beet)
+                 .values_list('pk', 'amount')),
+            [(amounts[self.beet.pk], 500)]
+        )
+        self.assertEqual(self.get_shopping_list(),
+                         {self.beet.pk: 500, self.cabbage.pk: 200})
+
+    def test_shopping_lists_verify_after_edits(self):
+        self.client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        self.client.force_authenticate(self.author)
+        self.client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        self.client.patch(f'/api/recipes/{self.recipe.pk}/', {
+            'ingredients': [{'id': self.beet.pk, 'amount': 100}],
+        }, format='json')
+        self.assertEqual(self.get_shopping_list(), {self.beet.pk: 100})
+        self.assertEqual(self.get_shopping_list(self.author),
+                         {self.beet.pk: 100})
+        self.client.delete(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        output = io.StringIO()
+        call_command('shopping_lists', verify=True, stdout=output)
+        self.assertIn('согласованы', output.getvalue())
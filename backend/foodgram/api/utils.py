@@ -1,7 +1,61 @@
+import csv
+import json
+
+from django.db.models import (BooleanField, OuterRef, Prefetch, Subquery,
+                              Value)
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.generics import get_object_or_404
-from recipes.models import AmountOfIngredient, Ingredient, Recipe
+from recipes.models import AmountOfIngredient, Recipe
+from users.models import Subscription, User
+
+
+def get_recipe_queryset(user):
+    return Recipe.objects.with_related().annotate_user_flags(user)
+
+
+def get_subscribed_authors(request, authors):
+    if not hasattr(request, 'subscribed_authors'):
+        request.subscribed_authors = {}
+    subscribed = request.subscribed_authors
+    missing = {author.pk for author in authors} - subscribed.keys()
+    if missing:
+        found = set(Subscription.objects.filter(
+            user=request.user, author__in=missing
+        ).values_list('author_id', flat=True))
+        subscribed.update({pk: pk in found for pk in missing})
+    return subscribed
+
+
+def get_recipes_limit(request):
+    limit = request.query_params.get('recipes_limit')
+    if limit and limit.isdigit():
+        return int(limit)
+    return None
+
+
+def get_latest_recipes(recipes_limit=None):
+    recipes = Recipe.objects.defer('search_vector')
+    if recipes_limit is not None:
+        recipes = recipes.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).values('pk')[:recipes_limit]
+        ))
+    return recipes
+
+
+def get_subscriptions_queryset(user, recipes_limit=None):
+    return (
+        User.objects.filter(subscribing__user=user)
+        .annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        )
+        .prefetch_related(
+            Prefetch('recipes', queryset=get_latest_recipes(recipes_limit))
+        )
+        .order_by('username')
+    )
 
 
 def add_or_delete(self, id, serializer_class):
@@ -28,17 +82,104 @@ def add_or_delete(self, id, serializer_class):
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def add_or_delete_in_bulk(model, request, recipe_ids):
+    user = request.user
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    found = set(
+        Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', flat=True)
+    )
+    if request.method == 'POST':
+        changed = model.objects.bulk_insert_or_ignore(
+            {'user': user, 'recipe_id': pk} for pk in found
+        )
+        done, skipped = 'added', 'already_added'
+    else:
+        changed = model.objects.filter(
+            user=user, recipe__in=found
+        ).delete_returning()
+        done, skipped = 'removed', 'not_added'
+    changed = {instance.recipe_id for instance in changed}
+    return [
+        {'id': pk,
+         'status': (done if pk in changed
+                    else skipped if pk in found else 'not_found')}
+        for pk in recipe_ids
+    ]
+
+
 def creating_an_ingredient(ingredients, recipe):
-    ingredient_list = []
-    for ingredient in ingredients:
-        current_ingredient = get_object_or_404(Ingredient,
-                                               id=ingredient.get('id'))
-        amount = ingredient.get('amount')
-        ingredient_list.append(
-            AmountOfIngredient(
-                recipe=recipe,
-                ingredient=current_ingredient,
-                amount=amount
-            )
+    AmountOfIngredient.objects.bulk_create(
+        AmountOfIngredient(
+            recipe=recipe,
+            ingredient_id=ingredient.get('id'),
+            amount=ingredient.get('amount')
+        )
+        for ingredient in ingredients
+    )
+
+
+def updating_an_ingredient(ingredients, recipe):
+    current = {
+        item.ingredient_id: item
+        for item in AmountOfIngredient.objects.filter(recipe=recipe)
+    }
+    wanted = {
+        ingredient.get('id'): ingredient.get('amount')
+        for ingredient in ingredients
+    }
+    removed = current.keys() - wanted.keys()
+    added = wanted.keys() - current.keys()
+    changed = []
+    for ingredient_id in current.keys() & wanted.keys():
+        item = current[ingredient_id]
+        if item.amount != wanted[ingredient_id]:
+            item.amount = wanted[ingredient_id]
+            changed.append(item)
+    if removed:
+        AmountOfIngredient.objects.filter(
+            recipe=recipe, ingredient_id__in=removed
+        ).delete()
+    if changed:
+        AmountOfIngredient.objects.bulk_update(changed, ['amount'])
+    if added:
+        creating_an_ingredient(
+            [{'id': pk, 'amount': wanted[pk]} for pk in added], recipe
         )
-    AmountOfIngredient.objects.bulk_create(ingredient_list)
+    return removed | added | {item.ingredient_id for item in changed}
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(ingredients):
+    yield 'Cписок покупок:\n'
+    for ingredient in ingredients:
+        yield '{} - {} {}.\n'.format(*ingredient)
+
+
+def shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for ingredient in ingredients:
+        yield writer.writerow(ingredient)
+
+
+def shopping_list_json(ingredients):
+    separator = '['
+    for name, amount, measurement_unit in ingredients:
+        yield separator + json.dumps({
+            'name': name,
+            'amount': amount,
+            'measurement_unit': measurement_unit,
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', shopping_list_txt),
+    'csv': ('text/csv; charset=utf-8', shopping_list_csv),
+    'json': ('application/json', shopping_list_json),
+}
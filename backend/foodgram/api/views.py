@@ -1,24 +1,31 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.models import (Ingredient, Recipe,
-                            AmountOfIngredient, Tag,
-                            ShoppingCart, Favorite)
+from recipes.models import (Ingredient, Recipe, Tag, ShoppingCart,
+                            ShoppingListItem, Favorite)
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from users.models import Subscription, User
-from api.filters import IngredientFilter, RecipeFilter
+from api.cache import (INGREDIENTS_GENERATION_KEY, TAGS_GENERATION_KEY,
+                       AnonymousResponseCacheMixin,
+                       GenerationConditionalListMixin, conditional_response,
+                       get_recipe_version)
+from api.filters import RecipeFilter
+from api.indexes import ingredient_index, tag_index
 from api.pagination import CustomPagination
 from api.permissions import IsOwnerOrReadOnly
+from api.utils import (SHOPPING_LIST_FORMATS, add_or_delete_in_bulk,
+                       get_recipe_queryset, get_recipes_limit,
+                       get_subscriptions_queryset)
 from api.serializers import (IngredientSerializer,
-                             RecipeCreateSerializer, RecipeReadSerializer,
-                             RecipeSerializer, SetPasswordSerializer,
-                             SubscribeSerializer, SubscribeInfoSerializer,
-                             TagSerializer, UserSerializer,
-                             UserCreateSerializer)
+                             RecipeCreateSerializer, RecipeIdsSerializer,
+                             RecipeReadSerializer, RecipeSerializer,
+                             SetPasswordSerializer, SubscribeSerializer,
+                             SubscribeInfoSerializer, TagSerializer,
+                             UserSerializer, UserCreateSerializer)
 
 
 class UserViewSet(mixins.CreateModelMixin,
@@ -28,6 +35,8 @@ class UserViewSet(mixins.CreateModelMixin,
     queryset = User.objects.all()
     pagination_class = CustomPagination
     permission_classes = (AllowAny,)
+    query_budgets = {'list': 5, 'retrieve': 4, 'me': 2, 'subscriptions': 6,
+                     'subscribe': 8}
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -55,110 +64,197 @@ class UserViewSet(mixins.CreateModelMixin,
             permission_classes=(IsAuthenticated,),
             pagination_class=CustomPagination)
     def subscriptions(self, request):
-        queryset = User.objects.filter(subscribing__user=request.user)
+        recipes_limit = get_recipes_limit(request)
+        queryset = get_subscriptions_queryset(request.user, recipes_limit)
         page = self.paginate_queryset(queryset)
-        serializer = SubscribeInfoSerializer(page, many=True,
-                                             context={'request': request})
+        serializer = SubscribeInfoSerializer(
+            page, many=True,
+            context={'request': request, 'recipes_limit': recipes_limit}
+        )
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,))
+    @transaction.atomic
     def subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=kwargs['pk'])
-
         if request.method == 'POST':
+            author = get_object_or_404(User, id=kwargs['pk'])
             serializer = SubscribeSerializer(
                 author, data=request.data, context={'request': request})
             serializer.is_valid(raise_exception=True)
-            Subscription.objects.create(user=request.user, author=author)
+            if not Subscription.objects.insert_or_ignore(user=request.user,
+                                                         author=author):
+                return Response({'errors': 'Вы уже подписаны на автора.'},
+                                status=status.HTTP_400_BAD_REQUEST)
             return Response(serializer.data,
                             status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            get_object_or_404(Subscription, user=request.user,
-                              author=author).delete()
+            if not Subscription.objects.filter(
+                user=request.user, author_id=kwargs['pk']
+            ).delete_returning():
+                raise Http404
             return Response({'detail': 'Успешная отписка'},
                             status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(GenerationConditionalListMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    generation_key = INGREDIENTS_GENERATION_KEY
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny, )
-    filter_backends = (DjangoFilterBackend, )
-    filterset_class = IngredientFilter
     pagination_class = None
+    query_budgets = {'list': 3, 'retrieve': 3}
 
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_list(self.list_from_index, request,
+                                         *args, **kwargs)
 
-class TagViewSet(viewsets.ModelViewSet):
+    def list_from_index(self, request, *args, **kwargs):
+        limit = request.query_params.get('limit')
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''),
+            int(limit) if limit and limit.isdigit() else None
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        ingredient = str(kwargs['pk']).isdigit() and ingredient_index.get(
+            int(kwargs['pk'])
+        )
+        if not ingredient:
+            raise Http404
+        return Response(self.get_serializer(ingredient).data)
+
+
+class TagViewSet(GenerationConditionalListMixin, viewsets.ModelViewSet):
+    generation_key = TAGS_GENERATION_KEY
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny, )
     pagination_class = None
+    query_budgets = {'list': 2, 'retrieve': 2}
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_list(self.list_from_index, request,
+                                         *args, **kwargs)
+
+    def list_from_index(self, request, *args, **kwargs):
+        return Response(self.get_serializer(tag_index.all(), many=True).data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsOwnerOrReadOnly, )
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
     http_method_names = ['get', 'post', 'patch', 'delete']
+    query_budgets = {
+        'list': 8, 'retrieve': 8, 'create': 16, 'partial_update': 30,
+        'destroy': 20, 'favorite': 6, 'shopping_cart': 12, 'favorites': 6,
+        'shopping_carts': 12, 'clear_shopping_cart': 12,
+        'download_shopping_cart': 4,
+    }
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            return get_recipe_queryset(self.request.user)
+        return Recipe.objects.defer('search_vector')
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
+    def retrieve(self, request, *args, **kwargs):
+        version = get_recipe_version(request, kwargs['pk'])
+        if version is None:
+            return super().retrieve(request, *args, **kwargs)
+        return conditional_response(request, super().retrieve, *version,
+                                    *args, **kwargs)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,))
+    @transaction.atomic
     def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-
         if request.method == 'POST':
-            serializer = RecipeSerializer(recipe, data=request.data,
+            recipe = get_object_or_404(Recipe, id=kwargs['pk'])
+            if not Favorite.objects.insert_or_ignore(user=request.user,
+                                                     recipe=recipe):
+                return Response({'errors': 'Рецепт уже в избранном.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            serializer = RecipeSerializer(recipe,
                                           context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            if not Favorite.objects.filter(user=request.user,
-                                           recipe=recipe).exists():
-                Favorite.objects.create(user=request.user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response({'errors': 'Рецепт уже в избранном.'},
-                            status=status.HTTP_400_BAD_REQUEST)
+            return Response(serializer.data,
+                            status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            get_object_or_404(Favorite, user=request.user,
-                              recipe=recipe).delete()
+            if not Favorite.objects.filter(
+                user=request.user, recipe_id=kwargs['pk']
+            ).delete_returning():
+                raise Http404
             return Response({'detail': 'Рецепт удален из избранного.'},
                             status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,),
             pagination_class=None)
+    @transaction.atomic
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-
         if request.method == 'POST':
-            serializer = RecipeSerializer(recipe, data=request.data,
+            recipe = get_object_or_404(Recipe, id=kwargs['pk'])
+            if not ShoppingCart.objects.insert_or_ignore(user=request.user,
+                                                         recipe=recipe):
+                return Response({'errors': 'Рецепт уже в списке покупок.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            serializer = RecipeSerializer(recipe,
                                           context={"request": request})
-            serializer.is_valid(raise_exception=True)
-            if not ShoppingCart.objects.filter(user=request.user,
-                                               recipe=recipe).exists():
-                ShoppingCart.objects.create(user=request.user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response({'errors': 'Рецепт уже в списке покупок.'},
-                            status=status.HTTP_400_BAD_REQUEST)
+            return Response(serializer.data,
+                            status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            get_object_or_404(ShoppingCart, user=request.user,
-                              recipe=recipe).delete()
+            if not ShoppingCart.objects.filter(
+                user=request.user, recipe_id=kwargs['pk']
+            ).delete_returning():
+                raise Http404
             return Response(
                 {'detail': 'Рецепт удален из списка покупок.'},
                 status=status.HTTP_204_NO_CONTENT
             )
 
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=(IsAuthenticated,),
+            url_path='favorite', url_name='favorites')
+    @transaction.atomic
+    def favorites(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = add_or_delete_in_bulk(
+            Favorite, request, serializer.validated_data['recipes']
+        )
+        return Response({'results': results})
+
+    @action(detail=False, methods=['post', 'delete'],
+            permission_classes=(IsAuthenticated,),
+            url_path='shopping_cart', url_name='shopping-carts')
+    @transaction.atomic
+    def shopping_carts(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = add_or_delete_in_bulk(
+            ShoppingCart, request, serializer.validated_data['recipes']
+        )
+        return Response({'results': results})
+
+    @action(detail=False, methods=['delete'],
+            permission_classes=(IsAuthenticated,))
+    @transaction.atomic
+    def clear_shopping_cart(self, request):
+        ShoppingCart.objects.filter(user=request.user).delete()
+        return Response({'detail': 'Список покупок очищен.'},
+                        status=status.HTTP_204_NO_CONTENT)
+
     @action(
         detail=False,
         methods=['get'],
@@ -166,19 +262,30 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def download_shopping_cart(self, request):
         user = request.user
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {'errors': 'Допустимые форматы: {}.'.format(
+                    ', '.join(SHOPPING_LIST_FORMATS))},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type, render = SHOPPING_LIST_FORMATS[export_format]
         ingredients = (
-            AmountOfIngredient.objects
-            .filter(recipe__shopping_cart__user=request.user)
-            .values('ingredient')
-            .annotate(total_amount=Sum('amount'))
-            .values_list('ingredient__name', 'total_amount',
+            ShoppingListItem.objects
+            .filter(user=user)
+            .values_list('ingredient__name', 'amount',
                          'ingredient__measurement_unit')
+            .order_by('ingredient__name', 'ingredient')
+            .iterator()
         )
-        file_list = []
-        [file_list.append(
-            '{} - {} {}.'.format(*ingredient)) for ingredient in ingredients]
-        filename = f'{user.username}_shopping_list.txt'
-        file = HttpResponse('Cписок покупок:\n' + '\n'.join(file_list),
-                            content_type='text/plain')
+        filename = f'{user.username}_shopping_list.{export_format}'
+        file = StreamingHttpResponse(render(ingredients),
+                                     content_type=content_type)
         file['Content-Disposition'] = (f'attachment; filename={filename}')
         return file
+
+    def perform_content_negotiation(self, request, force=False):
+        return super().perform_content_negotiation(
+            request,
+            force=force or self.action == 'download_shopping_cart'
+        )
@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -30,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +73,42 @@ DATABASES = {
     }
 }
 
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    default='django.core.cache.backends.filebased.FileBasedCache'
+)
+
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', default=BASE_DIR / 'cache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    },
+    'generations': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+        'KEY_PREFIX': 'generations',
+    },
+}
+
+if CACHE_BACKEND.endswith('.FileBasedCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=10000)),
+    }
+    CACHES['generations']['LOCATION'] = Path(CACHE_LOCATION) / 'generations'
+    CACHES['generations']['OPTIONS'] = {
+        'MAX_ENTRIES': int(
+            os.getenv('GENERATION_CACHE_MAX_ENTRIES', default=1000000)
+        ),
+    }
+
+RESPONSE_CACHE_ALIAS = 'default'
+
+GENERATION_CACHE_ALIAS = 'generations'
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -101,6 +140,59 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', default=5 * 1024 * 1024)
+)
+
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_UPLOAD_MAX_SIZE * 4 // 3 + 64 * 1024
+
+IMAGE_VARIANTS = {
+    'thumbnail': (150, 150),
+    'card': (480, 480),
+    'webp': None,
+}
+
+IMAGE_VARIANT_QUALITY = 80
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
+RECIPES_BATCH_MAX_SIZE = 100
+
+QUERY_BUDGET_ENABLED = os.getenv('QUERY_BUDGET_ENABLED', 'True') == 'True'
+
+QUERY_BUDGET_HEADERS = os.getenv('QUERY_BUDGET_HEADERS', 'False') == 'True'
+
+QUERY_BUDGET_RAISE = os.getenv('QUERY_BUDGET_RAISE', 'False') == 'True'
+
+QUERY_BUDGET_TOP = 5
+
+PROFILING_HEADER = 'HTTP_X_PROFILE'
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=0))
+
+PROFILING_MIN_DURATION_MS = int(
+    os.getenv('PROFILING_MIN_DURATION_MS', default=0)
+)
+
+PROFILING_DIR = os.getenv('PROFILING_DIR', default=BASE_DIR / 'profiles')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.queries': {
+            'handlers': ['console'],
+            'level': os.getenv('QUERY_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
@@ -0,0 +1,20 @@
+from django.db import transaction
+
+
+def on_commit_once(key, callback, values=(), using=None):
+    connection = transaction.get_connection(using)
+    batches = connection.__dict__.setdefault('on_commit_batches', {})
+    batch = batches.get(key)
+    if batch is not None and any(entry[1] is batch[0]
+                                 for entry in connection.run_on_commit):
+        batch[1].update(values)
+        return
+    pending = set(values)
+
+    def run():
+        if batches.get(key, (None,))[0] is run:
+            del batches[key]
+        callback(pending)
+
+    batches[key] = (run, pending)
+    transaction.on_commit(run, using)
@@ -0,0 +1,206 @@
+import json
+import statistics
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.management.commands.generate_data import USERNAME_PREFIX
+from recipes.models import Favorite, Ingredient, Recipe, Tag
+from users.models import User
+
+SCENARIOS = {
+    'recipes_anonymous': ((('get', '/api/recipes/?limit=6'),), False),
+    'recipes': ((('get', '/api/recipes/?limit=6'),), True),
+    'recipes_by_tags': ((('get', '/api/recipes/?limit=6&tags={tag}'),),
+                        True),
+    'recipes_favorited': ((('get', '/api/recipes/?is_favorited=1'),), True),
+    'recipes_search': ((('get', '/api/recipes/?search={word}'),), True),
+    'recipe_detail': ((('get', '/api/recipes/{recipe}/'),), True),
+    'tags': ((('get', '/api/tags/'),), False),
+    'ingredients_search': ((('get', '/api/ingredients/?name={prefix}'),),
+                           False),
+    'subscriptions': (
+        (('get', '/api/users/subscriptions/?recipes_limit=3'),), True
+    ),
+    'users': ((('get', '/api/users/?limit=6'),), True),
+    'download_shopping_cart': (
+        (('get', '/api/recipes/download_shopping_cart/'),), True
+    ),
+    'favorite_toggle': ((('post', '/api/recipes/{new_recipe}/favorite/'),
+                         ('delete', '/api/recipes/{new_recipe}/favorite/')),
+                        True),
+}
+
+
+def percentile(values, point):
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[point - 1]
+
+
+class RemoteClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, token):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        response = self.session.request(method, self.base_url + path,
+                                        headers=headers)
+        return response.status_code
+
+
+class LocalClient:
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, token):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        response = getattr(self.client, method)(path, **headers)
+        if hasattr(response, 'streaming_content'):
+            b''.join(response.streaming_content)
+        return response.status_code
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку, число запросов к БД и пропускную способность '
+            'основных эндпоинтов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Количество запросов на сценарий.')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scenario', action='append',
+                            choices=sorted(SCENARIOS),
+                            help='Запустить только указанные сценарии.')
+        parser.add_argument('--base-url',
+                            help='Адрес запущенного сервера; по умолчанию '
+                                 'используется тестовый клиент Django.')
+        parser.add_argument('--output', help='Файл для результатов в JSON.')
+        parser.add_argument('--baseline',
+                            help='JSON с предыдущими результатами.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост p95 относительно baseline.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).order_by('-followers_count', 'pk').first()
+        recipe = Recipe.objects.order_by('-favorites_count', 'pk').first()
+        if user is None or recipe is None:
+            raise CommandError(
+                'Нет данных, сначала выполните generate_data.'
+            )
+        token = Token.objects.get_or_create(user=user)[0].key
+        ingredient = Ingredient.objects.order_by('pk').first()
+        params = {
+            'tag': Tag.objects.order_by('pk').values_list(
+                'slug', flat=True
+            ).first(),
+            'word': recipe.name.split()[0],
+            'recipe': recipe.pk,
+            'new_recipe': self.get_unfavorited_recipe(user, recipe),
+            'prefix': ingredient.name[:3] if ingredient else '',
+        }
+        client = (RemoteClient(options['base_url']) if options['base_url']
+                  else LocalClient())
+        results = {
+            name: self.run_scenario(client, name, token, params, options)
+            for name in options['scenario'] or SCENARIOS
+        }
+        report = {
+            'meta': {
+                'client': options['base_url'] or 'django.test.Client',
+                'vendor': connection.vendor,
+                'requests': options['requests'],
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+            },
+            'scenarios': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        self.stdout.write(output)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def get_unfavorited_recipe(self, user, recipe):
+        new_recipe = Recipe.objects.exclude(
+            favorites__user=user
+        ).order_by('-favorites_count', 'pk').values_list(
+            'pk', flat=True
+        ).first()
+        if new_recipe is None:
+            Favorite.objects.filter(user=user, recipe=recipe).delete()
+            new_recipe = recipe.pk
+        return new_recipe
+
+    def run_scenario(self, client, name, token, params, options):
+        steps, authenticated = SCENARIOS[name]
+        steps = [(method, path.format(**params)) for method, path in steps]
+        token = token if authenticated else None
+        for _ in range(options['warmup']):
+            self.send(client, steps, token)
+        timings, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as context:
+                request_started = time.perf_counter()
+                status = self.send(client, steps, token)
+                timings.append((time.perf_counter() - request_started)
+                               * 1000)
+            queries.append(len(context.captured_queries))
+            errors += status >= 400
+        elapsed = time.perf_counter() - started
+        return {
+            'path': steps[0][1],
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+            'throughput_rps': round(len(timings) / elapsed, 1),
+            'queries_per_request': (
+                None if isinstance(client, RemoteClient)
+                else round(statistics.mean(queries), 1)
+            ),
+            'errors': errors,
+        }
+
+    def send(self, client, steps, token):
+        return max(client.request(method, path, token)
+                   for method, path in steps)
+
+    def compare(self, results, baseline, tolerance):
+        with open(baseline, encoding='utf-8') as file:
+            previous = json.load(file)['scenarios']
+        regressions = []
+        for name, current in results.items():
+            if name not in previous:
+                continue
+            before = previous[name]
+            p95_ratio = current['p95_ms'] / max(before['p95_ms'], 0.01)
+            self.stdout.write(
+                f'{name}: p95 {before["p95_ms"]} -> {current["p95_ms"]} мс '
+                f'({p95_ratio:.2f}x), запросов '
+                f'{before["queries_per_request"]} -> '
+                f'{current["queries_per_request"]}'
+            )
+            if p95_ratio > 1 + tolerance:
+                regressions.append(f'{name}: p95')
+            if (current['queries_per_request'] is not None
+                    and before['queries_per_request'] is not None
+                    and current['queries_per_request']
+                    > before['queries_per_request']):
+                regressions.append(f'{name}: запросы к БД')
+        if regressions:
+            raise CommandError(
+                'Регрессии: {}.'.format(', '.join(regressions))
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий не найдено.'))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.utils import get_latest_recipes
+from recipes.models import Favorite, Recipe, ShoppingCart, ShoppingListItem
+from users.models import Subscription, User
+
+
+def get_hot_queries(user, recipe):
+    return (
+        ('Проверка избранного',
+         Favorite.objects.filter(user=user, recipe=recipe),
+         'unique_favorite'),
+        ('Проверка корзины',
+         ShoppingCart.objects.filter(user=user, recipe=recipe),
+         'unique_shopping_cart'),
+        ('Проверка подписки',
+         Subscription.objects.filter(user=user, author=recipe.author_id),
+         'unique_subscription'),
+        ('Флаги is_favorited/is_in_shopping_cart',
+         Recipe.objects.annotate_user_flags(user)
+         .filter(is_favorited=True, is_in_shopping_cart=True),
+         'unique_shopping_cart'),
+        ('Пересчет списка покупок',
+         ShoppingListItem.objects.expected([user.pk]),
+         'amount_recipe_ingredient_idx'),
+        ('Последние рецепты авторов в подписках',
+         get_latest_recipes(3).filter(author=recipe.author_id),
+         'recipe_author_pub_date_idx'),
+    )
+
+
+class Command(BaseCommand):
+    help = ('Проверяет через EXPLAIN, что горячие запросы используют '
+            'составные индексы.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Проверка доступна только для PostgreSQL.')
+        user = User.objects.order_by('pk').first() or User(pk=1)
+        recipe = Recipe.objects.order_by('pk').first() or Recipe(
+            pk=1, author_id=user.pk
+        )
+        failed = []
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for title, queryset, index in get_hot_queries(user, recipe):
+                plan = queryset.explain()
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{title}:\n{plan}\n')
+                if index in plan:
+                    self.stdout.write(f'{title}: {index} - ok')
+                else:
+                    self.stdout.write(self.style.ERROR(
+                        f'{title}: {index} не используется'
+                    ))
+                    failed.append(title)
+        if failed:
+            raise CommandError(
+                'Индексы не используются: {}.'.format(', '.join(failed))
+            )
+        self.stdout.write(self.style.SUCCESS('Все индексы используются.'))
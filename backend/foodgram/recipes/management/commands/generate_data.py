@@ -0,0 +1,155 @@
+import io
+import random
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+
+from api.cache import (INGREDIENTS_GENERATION_KEY, TAGS_GENERATION_KEY,
+                       bump_generation, bump_recipes_generation)
+from recipes.models import (AmountOfIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscription, User
+
+USERNAME_PREFIX = 'bench_'
+PASSWORD = 'bench-password'
+
+
+def skewed_weights(size, exponent):
+    return [1 / (rank ** exponent) for rank in range(1, size + 1)]
+
+
+def pick_unique(rng, population, weights, count):
+    count = min(count, len(population))
+    picked = set()
+    while len(picked) < count:
+        picked.update(rng.choices(population, weights, k=count - len(picked)))
+    return picked
+
+
+class Command(BaseCommand):
+    help = 'Создает синтетический набор данных для нагрузочных тестов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число избранных на пользователя.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель степенного распределения '
+                                 'популярности авторов и рецептов.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dump',
+                            default=settings.BASE_DIR / 'data' / 'dump.json',
+                            help='Фикстура с тегами и ингредиентами.')
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданные данные.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if options['clear']:
+            deleted, _ = User.objects.filter(
+                username__startswith=USERNAME_PREFIX
+            ).delete()
+            self.stdout.write(f'Удалено объектов: {deleted}.')
+        with transaction.atomic():
+            call_command('load_reference_data', options['dump'],
+                         stdout=io.StringIO())
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(rng, users, options['recipes'],
+                                          options['skew'])
+            self.create_links(rng, Favorite, 'recipe', users, recipes,
+                              options['favorites'], options['skew'])
+            self.create_links(rng, ShoppingCart, 'recipe', users, recipes,
+                              options['carts'], options['skew'])
+            self.create_links(rng, Subscription, 'author', users, users,
+                              options['follows'], options['skew'])
+            Recipe.objects.filter(pk__in=recipes).update_search_vector()
+            ShoppingListItem.objects.refresh(users)
+        call_command('reconcile_counters', stdout=io.StringIO())
+        bump_recipes_generation()
+        bump_generation(TAGS_GENERATION_KEY)
+        bump_generation(INGREDIENTS_GENERATION_KEY)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, '
+            f'рецептов: {len(recipes)}.'
+        ))
+
+    def create_users(self, count):
+        start = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).count()
+        password = make_password(PASSWORD)
+        created = User.objects.bulk_create(
+            (User(username=f'{USERNAME_PREFIX}{number}',
+                  email=f'{USERNAME_PREFIX}{number}@example.com',
+                  first_name='Bench', last_name=str(number),
+                  password=password)
+             for number in range(start, start + count)),
+            batch_size=self.batch_size
+        )
+        return list(User.objects.filter(
+            username__in=[user.username for user in created]
+        ).values_list('pk', flat=True))
+
+    def create_image(self):
+        content = io.BytesIO()
+        Image.new('RGB', (480, 480), (230, 180, 120)).save(content, 'PNG')
+        return Recipe._meta.get_field('image').storage.save(
+            Recipe._meta.get_field('image').upload_to + 'bench.png',
+            ContentFile(content.getvalue())
+        )
+
+    def create_recipes(self, rng, users, count, skew):
+        image = self.create_image()
+        tags = list(Tag.objects.values_list('pk', flat=True))
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        authors = rng.choices(users, skewed_weights(len(users), skew),
+                              k=count)
+        recipes = Recipe.objects.bulk_create(
+            (Recipe(author_id=author, name=f'Рецепт {number}',
+                    text=f'Описание рецепта {number}. ' * 5, image=image,
+                    cooking_time=rng.randint(5, 180))
+             for number, author in enumerate(authors)),
+            batch_size=self.batch_size
+        )
+        recipes = list(Recipe.objects.filter(
+            author__in=users
+        ).order_by('-pk').values_list('pk', flat=True)[:len(recipes)])
+        AmountOfIngredient.objects.bulk_create(
+            (AmountOfIngredient(recipe_id=recipe, ingredient_id=ingredient,
+                                amount=rng.randint(1, 500))
+             for recipe in recipes
+             for ingredient in rng.sample(ingredients, rng.randint(3, 12))),
+            batch_size=self.batch_size
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+             for recipe in recipes
+             for tag in rng.sample(tags, rng.randint(1, len(tags)))),
+            batch_size=self.batch_size
+        )
+        return recipes
+
+    def create_links(self, rng, model, field, users, targets, average,
+                     skew):
+        weights = skewed_weights(len(targets), skew)
+        model.objects.bulk_create(
+            (model(user_id=user, **{f'{field}_id': target})
+             for user in users
+             for target in pick_unique(rng, targets, weights,
+                                       rng.randint(0, 2 * average))
+             if target != user or field != 'author'),
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
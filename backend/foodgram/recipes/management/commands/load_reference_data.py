@@ -0,0 +1,211 @@
+import csv
+import io
+import json
+import re
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import (INGREDIENTS_GENERATION_KEY, TAGS_GENERATION_KEY,
+                       bump_generation)
+from recipes.models import Ingredient, Tag
+
+MODELS = {
+    'ingredient': (Ingredient, ('name', 'measurement_unit'),
+                   INGREDIENTS_GENERATION_KEY),
+    'tag': (Tag, ('name', 'color', 'slug'), TAGS_GENERATION_KEY),
+}
+FORMATS = {
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+}
+SEPARATORS = re.compile(r'[\s,]*')
+CHUNK_SIZE = 64 * 1024
+COPY_TABLE = 'ingredient_import'
+
+
+def iter_json_array(file):
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('JSON-файл должен содержать массив объектов.')
+    position = 1
+    eof = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            if eof:
+                raise CommandError(f'Некорректный JSON: {error}.')
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def iter_ndjson(file):
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            raise CommandError(f'Строка {number}: некорректный JSON: {error}.')
+
+
+def iter_csv(file, fields, delimiter):
+    for number, row in enumerate(csv.reader(file, delimiter=delimiter), 1):
+        if not row:
+            continue
+        if number == 1 and [value.strip() for value in row] == list(fields):
+            continue
+        if len(row) != len(fields):
+            raise CommandError(
+                f'Строка {number}: ожидались столбцы {", ".join(fields)}.'
+            )
+        yield dict(zip(fields, row))
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты и теги из JSON, NDJSON или CSV. '
+            'Существующие записи пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', type=Path)
+        parser.add_argument('--format', choices=sorted(set(FORMATS.values())),
+                            help='По умолчанию определяется по расширению.')
+        parser.add_argument('--model', choices=MODELS, default='ingredient',
+                            help='Модель для записей без поля model.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Не использовать COPY на PostgreSQL.')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.use_copy = (connection.vendor == 'postgresql'
+                         and not options['no_copy'])
+        started = time.perf_counter()
+        processed = dict.fromkeys(MODELS, 0)
+        with transaction.atomic():
+            before = {name: model.objects.count()
+                      for name, (model, _, _) in MODELS.items()}
+            if self.use_copy:
+                self.create_copy_table()
+            for path in options['paths']:
+                for name, rows in self.read(path, options).items():
+                    processed[name] += rows
+            inserted = {name: model.objects.count() - before[name]
+                        for name, (model, _, _) in MODELS.items()}
+            for name, (_, _, generation_key) in MODELS.items():
+                if inserted[name]:
+                    transaction.on_commit(
+                        lambda key=generation_key: bump_generation(key)
+                    )
+        elapsed = time.perf_counter() - started
+        for name, (model, _, _) in MODELS.items():
+            if processed[name]:
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: '
+                    f'обработано {processed[name]}, '
+                    f'добавлено {inserted[name]}, '
+                    f'пропущено {processed[name] - inserted[name]}.'
+                )
+        total = sum(processed.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк: {total} за {elapsed:.2f} с '
+            f'({total / elapsed:.0f} строк/с).'
+        ))
+
+    def read(self, path, options):
+        file_format = options['format'] or FORMATS.get(path.suffix.lower())
+        if file_format is None:
+            raise CommandError(f'Не удалось определить формат файла {path}.')
+        default_model = options['model']
+        batches = {name: [] for name in MODELS}
+        processed = dict.fromkeys(MODELS, 0)
+        with open(path, encoding='utf-8-sig', newline='') as file:
+            if file_format == 'csv':
+                records = iter_csv(file, MODELS[default_model][1],
+                                   options['delimiter'])
+            elif file_format == 'ndjson':
+                records = iter_ndjson(file)
+            else:
+                records = iter_json_array(file)
+            for number, record in enumerate(records, 1):
+                name, values = self.parse(number, record, default_model)
+                batches[name].append(values)
+                processed[name] += 1
+                if len(batches[name]) >= self.batch_size:
+                    self.flush(name, batches[name])
+                    batches[name] = []
+        for name, rows in batches.items():
+            self.flush(name, rows)
+        return processed
+
+    def parse(self, number, record, default_model):
+        if not isinstance(record, dict):
+            raise CommandError(f'Запись {number}: ожидался объект.')
+        name = default_model
+        if 'model' in record and 'fields' in record:
+            name = record['model'].rpartition('.')[2]
+            record = record['fields']
+        if name not in MODELS:
+            raise CommandError(f'Запись {number}: неизвестная модель {name}.')
+        values = []
+        for field in MODELS[name][1]:
+            value = str(record.get(field) or '').strip()
+            if not value:
+                raise CommandError(
+                    f'Запись {number}: не заполнено поле {field}.'
+                )
+            values.append(value)
+        return name, tuple(values)
+
+    def flush(self, name, rows):
+        if not rows:
+            return
+        model, fields, _ = MODELS[name]
+        if self.use_copy and model is Ingredient:
+            self.copy_ingredients(rows)
+            return
+        model.objects.bulk_create(
+            (model(**dict(zip(fields, values))) for values in rows),
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+
+    def create_copy_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {COPY_TABLE} ('
+                'name varchar(200), measurement_unit varchar(200)'
+                ') ON COMMIT DROP'
+            )
+
+    def copy_ingredients(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {COPY_TABLE} (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM {COPY_TABLE} '
+                'ON CONFLICT DO NOTHING'
+            )
+            cursor.execute(f'TRUNCATE {COPY_TABLE}')
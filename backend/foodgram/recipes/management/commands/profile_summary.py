@@ -0,0 +1,66 @@
+import io
+import pstats
+import statistics
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.profiling import parse_profile_name
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+
+class Command(BaseCommand):
+    help = 'Сводка по сохраненным профилям запросов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir',
+            help='Каталог с профилями, по умолчанию PROFILING_DIR.'
+        )
+        parser.add_argument(
+            '--view',
+            help='Только профили действия, например '
+                 'RecipeViewSet.download_shopping_cart.'
+        )
+        parser.add_argument('--sort', choices=SORT_KEYS, default='cumulative')
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=25,
+            help='Количество функций в сводке по каждому действию.'
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'] or settings.PROFILING_DIR)
+        groups = defaultdict(list)
+        for path in sorted(directory.glob('*.prof')):
+            profile = parse_profile_name(path.name)
+            if profile is None:
+                continue
+            if options['view'] and profile['view'] != options['view']:
+                continue
+            groups[profile['view']].append((path, profile))
+        if not groups:
+            raise CommandError(f'Профили не найдены в {directory}.')
+        for view, profiles in sorted(
+            groups.items(),
+            key=lambda item: -sum(profile['duration']
+                                  for _, profile in item[1])
+        ):
+            durations = [profile['duration'] for _, profile in profiles]
+            users = {profile['user'] for _, profile in profiles}
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{view}: {len(profiles)} запросов, '
+                f'медиана {statistics.median(durations)} мс, '
+                f'максимум {max(durations)} мс, '
+                f'пользователей {len(users)}'
+            ))
+            output = io.StringIO()
+            stats = pstats.Stats(*(str(path) for path, _ in profiles),
+                                 stream=output)
+            stats.strip_dirs().sort_stats(options['sort'])
+            stats.print_stats(options['limit'])
+            self.stdout.write(output.getvalue())
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Subscription, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def count_related(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field)
+        .annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает или проверяет денормализованные счетчики.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить счетчики с фактическими значениями.'
+        )
+
+    def handle(self, *args, **options):
+        mismatched = 0
+        for model, counter, related_model, field in COUNTERS:
+            expected = count_related(related_model, field)
+            stale = (
+                model.objects.annotate(expected=expected)
+                .exclude(**{counter: F('expected')})
+                .values_list('pk', counter, 'expected')
+            )
+            for pk, stored, actual in stale[:20]:
+                self.stdout.write(
+                    f'{model._meta.model_name}={pk} {counter}: ожидается '
+                    f'{actual}, сохранено {stored}'
+                )
+            count = stale.count()
+            mismatched += count
+            if count and not options['verify']:
+                model.objects.filter(
+                    pk__in=stale.values('pk')
+                ).update(**{counter: expected})
+        if not options['verify']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Счетчики пересчитаны, исправлено: {mismatched}.'
+            ))
+            return
+        if mismatched:
+            raise CommandError(f'Расхождений в счетчиках: {mismatched}.')
+        self.stdout.write(self.style.SUCCESS('Счетчики согласованы.'))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает или проверяет агрегированные списки покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить сохраненные списки с корзинами.'
+        )
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            ShoppingListItem.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                'Списки покупок пересобраны: {} позиций.'.format(
+                    ShoppingListItem.objects.count())
+            ))
+            return
+        expected = {
+            (user, ingredient): total
+            for user, ingredient, total
+            in ShoppingListItem.objects.expected().iterator()
+        }
+        stored = {
+            (user, ingredient): amount
+            for user, ingredient, amount
+            in ShoppingListItem.objects.values_list(
+                'user', 'ingredient', 'amount'
+            ).iterator()
+        }
+        mismatched = {
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        }
+        for user, ingredient in sorted(mismatched)[:20]:
+            self.stdout.write(
+                f'user={user} ingredient={ingredient}: ожидается '
+                f'{expected.get((user, ingredient))}, сохранено '
+                f'{stored.get((user, ingredient))}'
+            )
+        if mismatched:
+            raise CommandError(
+                f'Расхождений в списках покупок: {len(mismatched)}.'
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок согласованы.'))
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:20
+
+import django.contrib.postgres.operations
+import django.contrib.postgres.search
+from django.db import migrations
+
+SEARCH_INDEXES_SQL = (
+    'CREATE INDEX recipe_search_vector_idx ON recipes_recipe '
+    'USING gin (search_vector)',
+    'CREATE INDEX recipe_name_trgm_idx ON recipes_recipe '
+    'USING gin (name gin_trgm_ops)',
+)
+
+DROP_SEARCH_INDEXES_SQL = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'DROP INDEX IF EXISTS recipe_name_trgm_idx',
+)
+
+FILL_SEARCH_VECTOR_SQL = """
+    UPDATE recipes_recipe r SET search_vector =
+        setweight(to_tsvector('russian', r.name), 'A')
+        || setweight(to_tsvector('russian', r.text), 'B')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM recipes_amountofingredient a
+            JOIN recipes_ingredient i ON i.id = a.ingredient_id
+            WHERE a.recipe_id = r.id
+        ), '')), 'C')
+"""
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in SEARCH_INDEXES_SQL:
+        schema_editor.execute(sql)
+    schema_editor.execute(FILL_SEARCH_VECTOR_SQL)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_SEARCH_INDEXES_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
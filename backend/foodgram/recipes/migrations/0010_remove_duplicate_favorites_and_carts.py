@@ -0,0 +1,72 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+def remove_duplicates(model, fields):
+    duplicates = (
+        model.objects.values(*fields)
+        .annotate(keep=models.Min('pk'), total=models.Count('pk'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    affected = []
+    for row in list(duplicates):
+        model.objects.filter(
+            **{field: row[field] for field in fields}
+        ).exclude(pk=row['keep']).delete()
+        affected.append(row)
+    return affected
+
+
+def remove_duplicate_favorites_and_carts(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    AmountOfIngredient = apps.get_model('recipes', 'AmountOfIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+
+    recipes = {row['recipe'] for row in remove_duplicates(
+        Favorite, ('user', 'recipe')
+    )}
+    if recipes:
+        Recipe.objects.filter(pk__in=recipes).update(
+            favorites_count=models.Subquery(
+                Favorite.objects.filter(recipe=models.OuterRef('pk'))
+                .order_by().values('recipe')
+                .annotate(total=models.Count('pk')).values('total')
+            )
+        )
+
+    users = {row['user'] for row in remove_duplicates(
+        ShoppingCart, ('user', 'recipe')
+    )}
+    if users:
+        ShoppingListItem.objects.filter(user__in=users).delete()
+        totals = (
+            AmountOfIngredient.objects
+            .filter(recipe__shopping_cart__user__in=users)
+            .values('recipe__shopping_cart__user', 'ingredient')
+            .annotate(total=models.Sum('amount'))
+            .values_list('recipe__shopping_cart__user', 'ingredient',
+                         'total')
+            .order_by()
+        )
+        ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                              amount=total)
+             for user, ingredient, total in totals.iterator()),
+            batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_favorites_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_favorites_and_carts,
+                             migrations.RunPython.noop),
+    ]
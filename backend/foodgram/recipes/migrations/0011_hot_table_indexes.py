@@ -0,0 +1,25 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_remove_duplicate_favorites_and_carts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='amountofingredient',
+            index=models.Index(fields=['recipe', 'ingredient'], include=('amount',), name='amount_recipe_ingredient_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
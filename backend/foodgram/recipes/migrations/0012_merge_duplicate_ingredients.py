@@ -0,0 +1,78 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    AmountOfIngredient = apps.get_model('recipes', 'AmountOfIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+
+    duplicates = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(keep=models.Min('pk'), total=models.Count('pk'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    recipes = set()
+    for row in list(duplicates):
+        removed = Ingredient.objects.filter(
+            name=row['name'], measurement_unit=row['measurement_unit']
+        ).exclude(pk=row['keep'])
+        amounts = AmountOfIngredient.objects.filter(ingredient__in=removed)
+        recipes.update(amounts.values_list('recipe', flat=True))
+        amounts.update(ingredient=row['keep'])
+        removed.delete()
+    if not recipes:
+        return
+
+    repeated = (
+        AmountOfIngredient.objects.filter(recipe__in=recipes)
+        .values('recipe', 'ingredient')
+        .annotate(keep=models.Min('pk'), total=models.Sum('amount'),
+                  rows=models.Count('pk'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for row in list(repeated):
+        AmountOfIngredient.objects.filter(
+            recipe=row['recipe'], ingredient=row['ingredient']
+        ).exclude(pk=row['keep']).delete()
+        AmountOfIngredient.objects.filter(pk=row['keep']).update(
+            amount=row['total']
+        )
+
+    users = set(
+        AmountOfIngredient.objects.filter(recipe__in=recipes)
+        .values_list('recipe__shopping_cart__user', flat=True)
+        .exclude(recipe__shopping_cart__user=None)
+    )
+    if users:
+        ShoppingListItem.objects.filter(user__in=users).delete()
+        totals = (
+            AmountOfIngredient.objects
+            .filter(recipe__shopping_cart__user__in=users)
+            .values('recipe__shopping_cart__user', 'ingredient')
+            .annotate(total=models.Sum('amount'))
+            .values_list('recipe__shopping_cart__user', 'ingredient',
+                         'total')
+            .order_by()
+        )
+        ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                              amount=total)
+             for user, ingredient, total in totals.iterator()),
+            batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_hot_table_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop),
+    ]
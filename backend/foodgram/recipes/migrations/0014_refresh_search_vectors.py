@@ -0,0 +1,32 @@
+# Generated by Django 3.2.15 on 2026-10-18 20:10
+
+from django.db import migrations
+
+FILL_SEARCH_VECTOR_SQL = """
+    UPDATE recipes_recipe r SET search_vector =
+        setweight(to_tsvector('russian', r.name), 'A')
+        || setweight(to_tsvector('russian', r.text), 'B')
+        || setweight(to_tsvector('russian', coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM recipes_amountofingredient a
+            JOIN recipes_ingredient i ON i.id = a.ingredient_id
+            WHERE a.recipe_id = r.id
+        ), '')), 'C')
+"""
+
+
+def refresh_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(FILL_SEARCH_VECTOR_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_ingredient_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(refresh_search_vectors,
+                             migrations.RunPython.noop),
+    ]
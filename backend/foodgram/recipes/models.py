@@ -1,6 +1,24 @@
+from collections import defaultdict
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField,
+                                            TrigramSimilarity)
 from django.core.validators import MinValueValidator
-from django.db import models
-from users.models import User
+from django.db import connections, models, transaction
+from django.db.models import (Exists, F, Func, OuterRef, Prefetch, Q,
+                              Subquery, Sum, Value)
+from django.db.models.functions import Coalesce
+from foodgram.transactions import on_commit_once
+from recipes.storage import ContentAddressedStorage
+from users.models import CountersMixin, LinkQuerySet, User
+
+SEARCH_CONFIG = 'russian'
+
+
+class Casefold(Func):
+    function = 'CASEFOLD'
+    output_field = models.TextField()
 
 
 class Tag(models.Model):
@@ -41,12 +59,89 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient'),
+        ]
 
     def __str__(self):
         return f'{self.name} ({self.measurement_unit})'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipes',
+                queryset=AmountOfIngredient.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
+    def annotate_user_flags(self, user):
+        if not user or user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+    def update_search_vector(self):
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        ingredient_names = (
+            AmountOfIngredient.objects
+            .filter(recipe=OuterRef('pk'))
+            .values('recipe')
+            .annotate(names=StringAgg('ingredient__name', ' '))
+            .values('names')
+        )
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+            + SearchVector(
+                Coalesce(Subquery(ingredient_names), Value('')),
+                weight='C', config=SEARCH_CONFIG
+            )
+        ))
+
+    def search(self, query):
+        if connections[self.db].vendor != 'postgresql':
+            query = query.casefold()
+            return self.alias(
+                folded_name=Casefold('name'),
+                folded_text=Casefold('text'),
+                folded_ingredient=Casefold('ingredients__name'),
+            ).filter(
+                Q(folded_name__contains=query)
+                | Q(folded_text__contains=query)
+                | Q(folded_ingredient__contains=query)
+            ).distinct()
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return self.annotate(
+            rank=(SearchRank(F('search_vector'), search_query)
+                  + TrigramSimilarity('name', query))
+        ).filter(
+            Q(search_vector=search_query) | Q(name__trigram_similar=query)
+        ).order_by('-rank', '-pub_date')
+
+
+class Recipe(CountersMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -59,7 +154,14 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         verbose_name='Изображние',
-        upload_to='recipes/'
+        upload_to='recipes/',
+        storage=ContentAddressedStorage()
+    )
+    image_variants = models.JSONField(
+        verbose_name='Варианты изображения',
+        default=dict,
+        blank=True,
+        editable=False
     )
     text = models.TextField(
         verbose_name='Описание',
@@ -89,11 +191,37 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ('favorites_count',)
+    derived_fields = ('image_variants', 'search_vector')
+    tracked_fields = ('name', 'text', 'image')
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -120,6 +248,11 @@ class AmountOfIngredient(models.Model):
     class Meta:
         verbose_name = 'Количество ингредиентов в рецепте'
         verbose_name_plural = 'Количество ингредиентов в рецептах'
+        indexes = [
+            models.Index(fields=['recipe', 'ingredient'],
+                         include=['amount'],
+                         name='amount_recipe_ingredient_idx'),
+        ]
 
     def __str__(self):
         return f'{self.ingredient} ({self.amount})'
@@ -139,9 +272,15 @@ class Favorite(models.Model):
         verbose_name='Избранный рецепт'
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_favorite'),
+        ]
 
     def __str__(self):
         return (f'Пользователь {self.user.username}'
@@ -162,10 +301,132 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзина покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_shopping_cart'),
+        ]
 
     def __str__(self):
         return (f'Пользователь {self.user.username}'
                 f'добавил {self.recipe.name} в корзину!')
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    def expected(self, users=None, ingredients=None):
+        totals = AmountOfIngredient.objects.all()
+        if users is not None:
+            totals = totals.filter(recipe__shopping_cart__user__in=users)
+        else:
+            totals = totals.filter(recipe__shopping_cart__isnull=False)
+        if ingredients is not None:
+            totals = totals.filter(ingredient__in=ingredients)
+        return (
+            totals
+            .values('recipe__shopping_cart__user', 'ingredient')
+            .annotate(total=Sum('amount'))
+            .values_list('recipe__shopping_cart__user', 'ingredient', 'total')
+            .order_by()
+        )
+
+    @transaction.atomic
+    def refresh(self, users, ingredients=None):
+        users = list(
+            User.objects.select_for_update()
+            .filter(pk__in=users)
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        items = self.filter(user__in=users)
+        if ingredients is not None:
+            items = items.filter(ingredient__in=ingredients)
+        items.delete()
+        self.bulk_create(
+            ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                             amount=total)
+            for user, ingredient, total in self.expected(users, ingredients)
+        )
+
+    def schedule_refresh(self, users=(), recipes=(), ingredients=None):
+        changes = [(user, None, None) for user in users]
+        for recipe in recipes:
+            if ingredients is None:
+                changes.append((None, recipe, None))
+            else:
+                changes.extend((None, recipe, ingredient)
+                               for ingredient in ingredients)
+        on_commit_once('shopping_lists',
+                       ShoppingListItem.objects.refresh_changes, changes)
+
+    def refresh_changes(self, changes):
+        users = set()
+        recipes = defaultdict(set)
+        for user, recipe, ingredient in changes:
+            if user is not None:
+                users.add(user)
+            else:
+                recipes[recipe].add(ingredient)
+        users.update(ShoppingCart.objects.filter(
+            recipe__in=[recipe for recipe, ingredients in recipes.items()
+                        if None in ingredients]
+        ).values_list('user', flat=True))
+        if users:
+            self.refresh(users)
+        partial = {recipe: ingredients
+                   for recipe, ingredients in recipes.items()
+                   if None not in ingredients}
+        if not partial:
+            return
+        carted_by = set(ShoppingCart.objects.filter(
+            recipe__in=partial
+        ).values_list('user', flat=True)) - users
+        if carted_by:
+            self.refresh(carted_by, set().union(*partial.values()))
+
+    @transaction.atomic
+    def rebuild(self):
+        self.all().delete()
+        self.bulk_create(
+            (ShoppingListItem(user_id=user, ingredient_id=ingredient,
+                              amount=total)
+             for user, ingredient, total in self.expected().iterator()),
+            batch_size=1000
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        default=0
+    )
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount}'
@@ -0,0 +1,132 @@
+from collections import defaultdict
+from threading import local
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from foodgram.transactions import on_commit_once
+from recipes.models import (AmountOfIngredient, Favorite, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem)
+from users.models import Subscription, User
+
+_deleting = local()
+
+
+def get_deleting(model):
+    if not hasattr(_deleting, 'pks'):
+        _deleting.pks = defaultdict(set)
+    return _deleting.pks[model]
+
+
+def is_being_deleted(model, pk):
+    return pk in get_deleting(model)
+
+
+def casefold(value):
+    return value.casefold() if value is not None else None
+
+
+def update_search_vectors(recipe_ids):
+    Recipe.objects.filter(pk__in=recipe_ids).update_search_vector()
+
+
+def refresh_search_vectors(recipe_ids):
+    on_commit_once('search_vectors', update_search_vectors, recipe_ids)
+
+
+@receiver(connection_created)
+def register_sqlite_functions(connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function('CASEFOLD', 1, casefold,
+                                              deterministic=True)
+
+
+@receiver(pre_delete, sender=Recipe)
+@receiver(pre_delete, sender=User)
+def remember_deleted_parent(sender, instance, **kwargs):
+    get_deleting(sender).add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def forget_deleted_parent(sender, instance, **kwargs):
+    get_deleting(sender).discard(instance.pk)
+
+
+@receiver(post_save, sender=Favorite)
+def count_added_favorite(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Recipe.change_counter([instance.recipe_id], 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def count_deleted_favorite(instance, **kwargs):
+    if not is_being_deleted(Recipe, instance.recipe_id):
+        Recipe.change_counter([instance.recipe_id], 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def count_added_recipe(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        User.change_counter([instance.author_id], 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(instance, **kwargs):
+    if not is_being_deleted(User, instance.author_id):
+        User.change_counter([instance.author_id], 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Subscription)
+def count_added_follower(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        User.change_counter([instance.author_id], 'followers_count', 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def count_deleted_follower(instance, **kwargs):
+    if not is_being_deleted(User, instance.author_id):
+        User.change_counter([instance.author_id], 'followers_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def index_saved_recipe(instance, raw=False, **kwargs):
+    changed_fields = getattr(instance, 'changed_fields', {'name', 'text'})
+    if raw or not {'name', 'text'} & changed_fields:
+        return
+    refresh_search_vectors([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=AmountOfIngredient)
+def index_recipe_ingredients(instance, raw=False, **kwargs):
+    if raw or is_being_deleted(Recipe, instance.recipe_id):
+        return
+    refresh_search_vectors([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def index_renamed_ingredient(instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    recipes = Recipe.objects.filter(ingredients=instance.pk)
+    refresh_search_vectors(recipes.values_list('pk', flat=True))
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def refresh_cart_shopping_list(instance, raw=False, **kwargs):
+    if raw or is_being_deleted(User, instance.user_id):
+        return
+    ShoppingListItem.objects.schedule_refresh(users=[instance.user_id])
+
+
+@receiver((post_save, post_delete), sender=AmountOfIngredient)
+def refresh_recipe_shopping_lists(signal, instance, created=False, raw=False,
+                                  **kwargs):
+    if raw or is_being_deleted(Recipe, instance.recipe_id):
+        return
+    ShoppingListItem.objects.schedule_refresh(
+        recipes=[instance.recipe_id],
+        ingredients=(None if signal is post_save and not created
+                     else [instance.ingredient_id])
+    )
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.15 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Subscription = apps.get_model('users', 'Subscription')
+    duplicates = (
+        Subscription.objects.values('user', 'author')
+        .annotate(keep=models.Min('pk'), total=models.Count('pk'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    authors = set()
+    for row in list(duplicates):
+        Subscription.objects.filter(
+            user=row['user'], author=row['author']
+        ).exclude(pk=row['keep']).delete()
+        authors.add(row['author'])
+    if authors:
+        User.objects.filter(pk__in=authors).update(
+            followers_count=models.Subquery(
+                Subscription.objects.filter(author=models.OuterRef('pk'))
+                .order_by().values('author')
+                .annotate(total=models.Count('pk')).values('total')
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_subscriptions,
+                             migrations.RunPython.noop),
+    ]
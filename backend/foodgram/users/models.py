@@ -1,8 +1,135 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import connections, models
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
 
 
-class User(AbstractUser):
+class CountersMixin:
+    counter_fields = ()
+    derived_fields = ()
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if cls.tracked_fields:
+            instance.remember_loaded_values(cls.tracked_fields)
+        return instance
+
+    def get_tracked_value(self, field):
+        value = self.__dict__[field]
+        return getattr(value, 'name', value)
+
+    def remember_loaded_values(self, fields):
+        self.__dict__.setdefault('loaded_values', {}).update(
+            (field, self.get_tracked_value(field))
+            for field in fields if field in self.__dict__
+        )
+
+    def get_changed_fields(self):
+        if self._state.adding:
+            return set(self.tracked_fields)
+        loaded = getattr(self, 'loaded_values', {})
+        return {
+            field for field in self.tracked_fields
+            if field in self.__dict__ and (
+                field not in loaded
+                or self.get_tracked_value(field) != loaded[field]
+            )
+        }
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+                and field.name not in self.derived_fields
+            ]
+        self.changed_fields = self.get_changed_fields()
+        if kwargs.get('update_fields') is not None:
+            self.changed_fields &= set(kwargs['update_fields'])
+        super().save(*args, **kwargs)
+        self.remember_loaded_values(self.changed_fields)
+
+    @classmethod
+    def change_counter(cls, pks, field, delta):
+        queryset = cls._default_manager.filter(pk__in=pks)
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        queryset.update(**{field: F(field) + delta})
+
+
+class LinkQuerySet(models.QuerySet):
+    def insert_or_ignore(self, **values):
+        created = self.bulk_insert_or_ignore([values])
+        return created[0] if created else None
+
+    def bulk_insert_or_ignore(self, rows):
+        instances = [self.model(**values) for values in rows]
+        if not instances:
+            return []
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        fields = [field for field in meta.concrete_fields
+                  if not field.primary_key]
+        row_sql = '({})'.format(', '.join(['%s'] * len(fields)))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {} ({}) VALUES {} '
+                'ON CONFLICT DO NOTHING RETURNING {}'.format(
+                    quote(meta.db_table),
+                    ', '.join(quote(field.column) for field in fields),
+                    ', '.join([row_sql] * len(instances)),
+                    ', '.join(quote(field.column)
+                              for field in meta.concrete_fields)
+                ),
+                [field.get_db_prep_save(getattr(instance, field.attname),
+                                        connection)
+                 for instance in instances for field in fields]
+            )
+            rows = cursor.fetchall()
+        created = [self.model.from_db(self.db, [field.attname for field
+                                                in meta.concrete_fields],
+                                      row)
+                   for row in rows]
+        for instance in created:
+            post_save.send(sender=self.model, instance=instance,
+                           created=True, update_fields=None, raw=False,
+                           using=self.db)
+        return created
+
+    def delete_returning(self):
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        columns = [field.column for field in meta.concrete_fields]
+        subquery, params = self.values('pk').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {table} WHERE {pk} IN ({subquery}) '
+                'RETURNING {columns}'.format(
+                    table=quote(meta.db_table),
+                    pk=quote(meta.pk.column),
+                    subquery=subquery,
+                    columns=', '.join(map(quote, columns))
+                ),
+                params
+            )
+            rows = cursor.fetchall()
+        deleted = [self.model.from_db(self.db, [field.attname for field
+                                                in meta.concrete_fields],
+                                      row)
+                   for row in rows]
+        for instance in deleted:
+            post_delete.send(sender=self.model, instance=instance,
+                             using=self.db)
+        return deleted
+
+
+class User(CountersMixin, AbstractUser):
     email = models.EmailField(
         verbose_name='Электронная почта',
         max_length=200,
@@ -17,6 +144,18 @@ class User(AbstractUser):
         'Пароль',
         max_length=150
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ('username',)
@@ -41,9 +180,15 @@ class Subscription(models.Model):
         verbose_name='Автор'
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_subscription'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} подписан на {self.author.username}'